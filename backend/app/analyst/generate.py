@@ -1,11 +1,14 @@
 """Code generation and execution module"""
+import asyncio
 import os
 import re
 import sys
+import threading
 import traceback
 from io import StringIO
 from contextlib import redirect_stdout
 from typing import Tuple, Dict, Any, Optional, Union, List
+from functools import lru_cache
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -19,6 +22,21 @@ from .prompts import f1_prompt
 
 logger = logging.getLogger(__name__)
 
+# Generated code keyed on (normalized query, columns, dtypes, follow-up flag).
+# Queries with the same text and schema produce the same analysis code.
+CODE_CACHE_MAX_SIZE = 512
+_code_cache: Dict[Tuple[Any, ...], str] = {}
+_code_cache_lock = threading.Lock()
+
+def _code_cache_key(df: pd.DataFrame, query: str, is_follow_up: bool) -> Tuple[Any, ...]:
+    """Build the generated-code cache key for a query against a DataFrame schema"""
+    return (
+        " ".join(query.lower().split()),
+        tuple(df.columns),
+        tuple(str(t) for t in df.dtypes),
+        is_follow_up
+    )
+
 def generate_code(data: Union[pd.DataFrame, Dict[str, Any]], query: str, is_follow_up: bool = False) -> str:
     """Generate Python code for F1 data analysis based on the query"""
     try:
@@ -28,6 +46,13 @@ def generate_code(data: Union[pd.DataFrame, Dict[str, Any]], query: str, is_foll
         else:
             df = data
 
+        # Reuse code generated earlier for the same query and schema
+        cache_key = _code_cache_key(df, query, is_follow_up)
+        cached = _code_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Generated code cache hit")
+            return cached
+
         # Get code generator
         generator = get_code_generator("gpt4")
 
@@ -52,6 +77,11 @@ Focus on answering the specific follow-up question using the existing data.
         if code is None:
             logger.error("No code block found in response")
             return ""
+        
+        with _code_cache_lock:
+            if len(_code_cache) >= CODE_CACHE_MAX_SIZE:
+                del _code_cache[next(iter(_code_cache))]
+            _code_cache[cache_key] = code
             
         return code
         
@@ -59,6 +89,16 @@ Focus on answering the specific follow-up question using the existing data.
         logger.exception("Error generating code")
         return ""
 
+def discard_generated_code(data: Union[pd.DataFrame, Dict[str, Any]], query: str, is_follow_up: bool = False) -> None:
+    """Drop cached code for a query and schema, e.g. after it failed to execute"""
+    df = pd.DataFrame(data) if isinstance(data, dict) else data
+    with _code_cache_lock:
+        _code_cache.pop(_code_cache_key(df, query, is_follow_up), None)
+
+async def generate_code_async(data: Union[pd.DataFrame, Dict[str, Any]], query: str, is_follow_up: bool = False) -> str:
+    """Run generate_code in a worker thread so the blocking model call doesn't stall the event loop"""
+    return await asyncio.to_thread(generate_code, data, query, is_follow_up)
+
 def extract_code_block(response: str) -> Optional[str]:
     """Extract Python code block from model's response"""
     pattern = r"```python\s*(.*?)\s*```"
@@ -80,6 +120,11 @@ def extract_code_block(response: str) -> Optional[str]:
     
     return code.strip()
 
+@lru_cache(maxsize=512)
+def _compile_code(source: str):
+    """Compile generated code once per distinct source string"""
+    return compile(source, '<generated>', 'exec')
+
 def execute_code_safely(code: str, data: pd.DataFrame) -> Tuple[bool, Dict[str, Any], str]:
     """Execute generated code in a safe environment"""
     try:
@@ -155,7 +200,7 @@ captured_figure = base64.b64encode(buffer.getvalue()).decode()
             modified_code = modified_code + "\n" + capture_code
             
         # Execute the modified code
-        exec(modified_code, globals_dict)
+        exec(_compile_code(modified_code), globals_dict)
         
         # Get the captured figure and output
         image_base64 = globals_dict.get('captured_figure', '')
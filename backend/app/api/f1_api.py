@@ -141,6 +141,9 @@ async def fetch_f1_data(endpoint: str, params: Optional[Dict[str, Any]] = None)
             
             processor = F1ResponseProcessor()
             
+            # Processed tables carry a natural key (driver, or season/round/position),
+            # so their rows are unique; the raw MRData fallback is not
+            deduped = True
             try:
                 if 'DriverTable' in data['MRData']:
                     df = processor.process_drivers(data)
@@ -153,6 +156,7 @@ async def fetch_f1_data(endpoint: str, params: Optional[Dict[str, Any]] = None)
                     df = processor.process_standings(data, standings_type)
                 else:
                     df = pd.DataFrame(data['MRData'])
+                    deduped = False
                 
                 if df.empty:
                     return {
@@ -172,7 +176,8 @@ async def fetch_f1_data(endpoint: str, params: Optional[Dict[str, Any]] = None)
                         'url': url,
                         'params': params,
                         'timestamp': datetime.now().isoformat(),
-                        'rows': len(df)
+                        'rows': len(df),
+                        'deduped': deduped
                     }
                 }
             except Exception as e:
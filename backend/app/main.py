@@ -1,29 +1,41 @@
 """Main application integrating F1 data pipeline with analysis"""
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+from typing import Dict, Any, Optional, List, Sequence, Tuple
+from functools import lru_cache
 import logging
+import os
+import time
 import pandas as pd
-import json
 import ast
+import orjson
 
 # FastAPI and Pydantic
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
+# Structured logging (moved to pythonjsonlogger.json in 3.x)
+try:
+    from pythonjsonlogger.json import JsonFormatter
+except ImportError:
+    from pythonjsonlogger.jsonlogger import JsonFormatter
+
 # Database models
 from app.models.user import User, QueryHistory
-from app.database import get_db, SessionLocal
-from sqlalchemy.orm import Session
+from app.database import AsyncSessionLocal, async_engine
 
 # Custom components
 from app.query.processor import QueryProcessor
 from app.pipeline.data2 import DataPipeline
+from app.pipeline.batcher import PipelineBatcher
 from app.pipeline.optimized_adapters import OptimizedQueryAdapter, OptimizedResultAdapter
-from app.analyst.generate import generate_code, execute_code_safely
+from app.analyst.generate import generate_code_async, execute_code_safely, discard_generated_code
 
-# Set up logging with more detail
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging: one JSON object per line at INFO by default.
+# DEBUG detail is opt-in via LOG_LEVEL=DEBUG; LOG_FORMAT=text gives plain lines for local use.
+log_handler = logging.StreamHandler()
+if os.getenv("LOG_FORMAT", "json").lower() == "json":
+    log_handler.setFormatter(JsonFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), handlers=[log_handler])
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
@@ -37,215 +49,387 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Completed analyses keyed on the normalized query text. Entries are only read
+# and written between awaits, so no lock is needed on the event loop.
+ANALYSIS_CACHE_TTL = 300  # seconds
+ANALYSIS_CACHE_MAX_SIZE = 1024
+_analysis_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
 # Request model
 class QueryRequest(BaseModel):
     query: str
 
+# Shared pipeline components. Built once and reused across requests so model
+# clients are not reallocated per call. The only state they retain is the query
+# adapter's cache of adapted queries (bounded by CacheManager's max_size/ttl).
+# Construction is lazy because QueryProcessor needs OPENAI_API_KEY, which may be
+# absent at import.
+@lru_cache(maxsize=None)
+def get_processor() -> QueryProcessor:
+    return QueryProcessor()
+
+@lru_cache(maxsize=None)
+def get_query_adapter() -> OptimizedQueryAdapter:
+    return OptimizedQueryAdapter()
+
+@lru_cache(maxsize=None)
+def get_pipeline() -> DataPipeline:
+    return DataPipeline()
+
+@lru_cache(maxsize=None)
+def get_pipeline_batcher() -> PipelineBatcher:
+    return PipelineBatcher(get_pipeline())
+
+@lru_cache(maxsize=None)
+def get_result_adapter() -> OptimizedResultAdapter:
+    return OptimizedResultAdapter()
+
+@app.on_event("startup")
+async def init_components() -> None:
+    """Warm the shared components so the first request doesn't pay setup cost."""
+    try:
+        get_processor()
+        get_query_adapter()
+        get_pipeline()
+        get_pipeline_batcher()
+        get_result_adapter()
+    except Exception as e:
+        logger.error("Failed to initialize pipeline components: %s", e)
+
+@app.on_event("shutdown")
+async def close_db() -> None:
+    """Close pooled async DB connections."""
+    await async_engine.dispose()
+
 def validate_constructor_data(data: Any) -> List[Dict]:
     """Validate and normalize constructor data to ensure consistent format."""
     if isinstance(data, str):
         try:
             # Try to parse string as JSON first
-            data = json.loads(data)
-        except json.JSONDecodeError:
+            data = orjson.loads(data)
+        except orjson.JSONDecodeError:
             try:
                 # If JSON fails, try ast.literal_eval
                 data = ast.literal_eval(data)
             except (ValueError, SyntaxError):
-                logger.error(f"Failed to parse constructor data: {data}")
+                logger.error("Failed to parse constructor data: %s", data)
                 return []
     
     if not isinstance(data, list):
-        logger.error(f"Constructor data is not a list: {type(data)}")
+        logger.error("Constructor data is not a list: %s", type(data))
         return []
         
     return data
 
-def normalize_constructor_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Normalize constructor data in DataFrame."""
-    try:
-        if 'ConstructorTable' not in df.columns:
-            logger.debug("No ConstructorTable column found")
-            return df
-            
-        logger.debug(f"ConstructorTable data types: {df['ConstructorTable'].apply(type).value_counts()}")
-        
-        # Validate and normalize ConstructorTable data
-        df['ConstructorTable'] = df['ConstructorTable'].apply(validate_constructor_data)
+@lru_cache(maxsize=4096)
+def _parse_constructor_table(raw: str) -> Tuple[Dict, ...]:
+    """Parse a raw ConstructorTable string. Cached because rows from the same
+    season carry identical tables. The returned dicts are shared by every row and
+    request with the same raw string, so callers must not mutate them."""
+    return tuple(validate_constructor_data(raw))
+
+def _constructor_entries(data: Any) -> Sequence[Dict]:
+    """Return the constructor entries for a ConstructorTable cell."""
+    if isinstance(data, str):
+        return _parse_constructor_table(data)
+    return validate_constructor_data(data)
+
+# Team ids come from parsed queries, so bound the number of specialized extractors
+@lru_cache(maxsize=64)
+def _extract_team(team_id: str):
+    """Build a ConstructorTable extractor specialized for one constructorId.
+    The returned function yields the team's entry in a row's table, or {}."""
+    def _inner(entries):
+        if not entries:
+            return {}
+        for item in entries:
+            # Exact class check skips the MRO walk isinstance does
+            if item.__class__ is dict and item.get('constructorId') == team_id:
+                return item
+        return {}
+    return _inner
+
+def normalize_constructor_data(df: pd.DataFrame, team_id: str = 'ferrari') -> pd.DataFrame:
+    """Normalize constructor data in DataFrame, expanding the given team's entry."""
+    if 'ConstructorTable' not in df.columns:
+        logger.debug("No ConstructorTable column found")
+        return df
         
-        # Extract Ferrari's data
-        df['constructor_data'] = df['ConstructorTable'].apply(
-            lambda x: next((item for item in x if isinstance(item, dict) and 
-                          item.get('constructorId') == 'ferrari'), {})
+    if logger.isEnabledFor(logging.DEBUG):
+        # A small sample is enough to see the type mix without a full-length pass
+        logger.debug(
+            "ConstructorTable data types (first 50 rows): %s",
+            df['ConstructorTable'].head(50).map(type).value_counts()
         )
+    
+    # Index labels are used to align the extracted data back to its rows
+    if not df.index.is_unique:
+        df = df.reset_index(drop=True)
+    
+    # Validate and normalize ConstructorTable data. No substring pre-filter:
+    # stringifying list-of-dicts cells costs more than the early-exit scan below
+    constructor_tables = df['ConstructorTable'].map(_constructor_entries)
+    
+    # Extract the team's entry per row; rows without one are left unmatched
+    # when the columns are aligned back on the index
+    team_data = constructor_tables.map(_extract_team(team_id))
+    team_data = team_data[team_data.map(bool)]
+    logger.debug("Extracted %s data for %s of %s rows", team_id, len(team_data), len(df))
+    
+    # Drop the original ConstructorTable column
+    df = df.drop(columns='ConstructorTable')
+    
+    # Expand constructor data onto the matching rows
+    if not team_data.empty:
+        try:
+            # Constructor records are flat, so a single normalize pass suffices;
+            # reuse the matched index directly rather than rebuilding it via set_index
+            constructor_df = pd.json_normalize(team_data.tolist(), max_level=1)
+            constructor_df.index = team_data.index
+            logger.debug("Normalized constructor columns: %s", constructor_df.columns)
+            # df is a fresh frame from drop(), so add the columns to it in place
+            # (index-aligned) instead of building another frame with join
+            for col in constructor_df.columns:
+                df[f"{col}_constructor" if col in df.columns else col] = constructor_df[col]
+        except (ValueError, KeyError, TypeError) as e:
+            # Keep original data if normalization fails
+            logger.error("Failed to normalize constructor data: %s", e)
         
-        # Log the extracted Ferrari data
-        logger.debug(f"Extracted Ferrari data sample: {df['constructor_data'].iloc[0] if not df.empty else None}")
-        
-        # Drop the original ConstructorTable column
-        df = df.drop('ConstructorTable', axis=1)
-        
-        # Expand constructor data if not empty
-        if not df.empty and df['constructor_data'].iloc[0]:
-            try:
-                constructor_df = pd.json_normalize(df['constructor_data'].tolist())
-                logger.debug(f"Normalized constructor columns: {constructor_df.columns}")
-                df = pd.concat([df.drop('constructor_data', axis=1), constructor_df], axis=1)
-            except Exception as e:
-                logger.error(f"Failed to normalize constructor data: {str(e)}")
-                # Keep original data if normalization fails
-                df = df.drop('constructor_data', axis=1)
-        else:
-            df = df.drop('constructor_data', axis=1)
-            
-        return df
-    except Exception as e:
-        logger.error(f"Error in normalize_constructor_data: {str(e)}")
-        return df
+    return df
 
-def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    """Clean DataFrame by removing duplicates and invalid data."""
+def clean_dataframe(df: pd.DataFrame, deduplicate: bool = True) -> pd.DataFrame:
+    """Clean DataFrame by removing duplicates and invalid data.
+    
+    Pass deduplicate=False when the pipeline already guarantees unique rows.
+    """
     logger.debug("Starting DataFrame cleaning")
-    logger.debug(f"Initial shape: {df.shape}")
+    logger.debug("Initial shape: %s", df.shape)
+    
+    # Build a single row mask so the frame is filtered in one pass
+    keep = pd.Series(True, index=df.index)
+    needs_filter = False
     
     # Remove rows where ConstructorTable is just a year number
     if 'ConstructorTable' in df.columns:
-        df = df[df['ConstructorTable'].apply(lambda x: not (isinstance(x, (int, float)) or (isinstance(x, str) and x.isdigit())))]
-        logger.debug(f"Shape after removing numeric ConstructorTable: {df.shape}")
-    
-    # Drop duplicates based on specific columns, excluding unhashable types
-    safe_columns = [col for col in df.columns if col != 'ConstructorTable']
-    if safe_columns:
-        df = df.drop_duplicates(subset=safe_columns)
-        logger.debug(f"Shape after dropping duplicates: {df.shape}")
+        needs_filter = True
+        ct = df['ConstructorTable']
+        numeric_mask = ct.map(lambda x: isinstance(x, (int, float)) or (isinstance(x, str) and x.isdigit()))
+        keep &= ~numeric_mask.astype(bool)
     
     # If we have both 'year' and 'season', ensure they match and keep one
+    columns = list(df.columns)
     if 'year' in df.columns and 'season' in df.columns:
-        df = df[df['year'] == df['season']]
-        df = df.drop('season', axis=1)
-        logger.debug(f"Shape after year/season reconciliation: {df.shape}")
+        keep &= df['year'] == df['season']
+        columns.remove('season')
+        needs_filter = True
+    
+    # Apply the row mask and column selection in one pass
+    if needs_filter:
+        df = df.loc[keep, columns]
+        logger.debug("Shape after row filtering: %s", df.shape)
+    
+    # Drop duplicates based on specific columns, excluding unhashable types.
+    # 'season' equals 'year' on the kept rows, so dropping it first doesn't
+    # change which rows are duplicates.
+    safe_columns = [col for col in df.columns if col != 'ConstructorTable']
+    if deduplicate and safe_columns:
+        try:
+            df = df.drop_duplicates(subset=safe_columns, ignore_index=True)
+            logger.debug("Shape after dropping duplicates: %s", df.shape)
+        except TypeError as e:
+            # Other columns can hold unhashable lists/dicts; keep the rows as-is
+            logger.warning("Skipping duplicate removal: %s", e)
     
     return df
 
+def _query_team(params: Dict[str, Any]) -> str:
+    """Constructor to expand from ConstructorTable; Ferrari unless the query names one team."""
+    constructor = params.get('constructor')
+    return constructor.strip().lower() if isinstance(constructor, str) and constructor.strip() else 'ferrari'
+
+def _unexpected_results(results: Any) -> pd.DataFrame:
+    """Reject pipeline results that can't be turned into a DataFrame."""
+    logger.error("Unexpected results type: %s", type(results))
+    raise ValueError(f"Cannot process results of type: {type(results)}")
+
+# Pipeline result type -> DataFrame constructor, looked up by exact type
+_MATERIALIZERS = {
+    pd.DataFrame: lambda r: r,
+    dict: lambda r: pd.DataFrame([r]),
+    list: pd.DataFrame,
+}
+
+def _normalize_query(query: str) -> str:
+    """Normalize a query for use as an analysis cache key."""
+    return " ".join(query.strip().lower().split())
+
+def _get_cached_analysis(query_norm: str) -> Optional[Dict[str, Any]]:
+    """Return a cached analysis result if present and not expired."""
+    entry = _analysis_cache.get(query_norm)
+    if entry is None:
+        return None
+    timestamp, result = entry
+    if time.monotonic() - timestamp >= ANALYSIS_CACHE_TTL:
+        del _analysis_cache[query_norm]
+        return None
+    return result
+
+def _cache_analysis(query_norm: str, result: Dict[str, Any]) -> None:
+    """Store a successful analysis result, evicting the oldest entry when full."""
+    _analysis_cache.pop(query_norm, None)
+    if len(_analysis_cache) >= ANALYSIS_CACHE_MAX_SIZE:
+        del _analysis_cache[next(iter(_analysis_cache))]
+    _analysis_cache[query_norm] = (time.monotonic(), result)
+
+async def _run_analysis(query: str, start_time: float) -> Dict[str, Any]:
+    """Run the full query -> pipeline -> codegen -> execute chain for a query.
+    
+    start_time is a time.perf_counter() reading taken when the request arrived.
+    """
+    # The result adapter measures against the wall clock
+    wall_start = time.time()
+    
+    # Step 1: Process query
+    query_result = await get_processor().process_query(query)
+    logger.debug("Query processing result: %s", query_result)
+    
+    # Step 2: Adapt query using optimized adapter
+    adapted_result = await get_query_adapter().adapt(query_result)
+    logger.debug("Adapted query result: %s", adapted_result)
+    
+    # Step 3: Process through optimized pipeline, sharing fetches with concurrent requests
+    requirements = adapted_result.to_data_requirements()
+    pipeline_response = await get_pipeline_batcher().process(requirements)
+    logger.debug("Pipeline response type: %s", type(pipeline_response))
+    
+    # Step 4: Adapt pipeline result
+    pipeline_result = await get_result_adapter().adapt_pipeline_result(pipeline_response, wall_start)
+    logger.debug("Pipeline result success: %s", pipeline_result.success)
+    
+    if not pipeline_result.success or pipeline_result.data is None:
+        logger.error("Pipeline failed: %s", pipeline_result.error)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Pipeline processing failed: {pipeline_result.error or 'No data returned'}"
+        )
+        
+    # Step 5: Generate and execute analysis code
+    results = pipeline_result.data.get('results', {})
+    logger.debug("Raw results type: %s", type(results))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Raw results structure: %s...",
+            orjson.dumps(results, default=str, option=orjson.OPT_NON_STR_KEYS)[:500].decode(errors='ignore')
+        )
+    
+    try:
+        # Handle different result types
+        df = _MATERIALIZERS.get(type(results), _unexpected_results)(results)
+        
+        # Clean the DataFrame before normalization
+        df = clean_dataframe(df, deduplicate=not pipeline_result.metadata.get('deduped', False))
+        logger.debug("DataFrame shape after cleaning: %s", df.shape)
+        logger.debug("Columns after cleaning: %s", df.columns)
+        
+        # Normalize the constructor data for the team the query asked about
+        df = normalize_constructor_data(df, _query_team(adapted_result.params))
+        logger.debug("Final DataFrame shape: %s", df.shape)
+        logger.debug("Final columns: %s", df.columns)
+        logger.debug("Data types: %s", df.dtypes)
+            
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error("DataFrame processing error: %s", e, exc_info=True)
+        raise HTTPException(status_code=400, detail=f"Failed to process data: {str(e)}")
+    
+    if df.empty:
+        raise HTTPException(status_code=400, detail="No data available after processing")
+    
+    # Generate and execute code with additional logging
+    logger.debug("Generating analysis code")
+    code = await generate_code_async(df, query)
+    logger.debug("Generated code: %s", code)
+    
+    success, result, executed_code = execute_code_safely(code, df)
+    logger.debug("Code execution success: %s", success)
+    
+    if not success:
+        logger.error("Code execution failed: %s", result)
+        # Don't serve the failing code to later requests for the same query and schema
+        discard_generated_code(df, query)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Code execution failed: {result}"
+        )
+        
+    # Return comprehensive result
+    return {
+        "success": True,
+        "data": result,
+        "executed_code": executed_code,
+        "query_trace": query_result.trace,
+        "processing_time": time.perf_counter() - start_time,
+        "metadata": pipeline_result.metadata
+    }
+
+async def _persist_query_history(query: str, result: Dict[str, Any]) -> None:
+    """Store an analysis in QueryHistory. Runs as a background task after the response is sent."""
+    try:
+        # Round-trip through orjson so dataclasses/numpy values in the metadata fit the JSON column
+        record = orjson.loads(orjson.dumps(
+            result,
+            default=str,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        ))
+        async with AsyncSessionLocal() as db:
+            db.add(QueryHistory(query=query, result=record))
+            await db.commit()
+    except Exception as e:
+        logger.error("Failed to persist query history: %s", e)
+
 @app.post("/api/v1/analyze")
-async def analyze_f1_data(request: QueryRequest) -> Dict[str, Any]:
+async def analyze_f1_data(request: QueryRequest, background_tasks: BackgroundTasks) -> Dict[str, Any]:
     """
     Process F1 data analysis queries using the optimized pipeline.
     
     Args:
         request: QueryRequest containing the natural language query
+        background_tasks: Used to write the query history after responding
         
     Returns:
         Dict containing analysis results, executed code, and processing metadata
     """
+    start_time = time.perf_counter()
     try:
-        start_time = datetime.now().timestamp()
-        logger.debug(f"Starting analysis with query: {request.query}")
-        
-        # Step 1: Process query
-        processor = QueryProcessor()
-        query_result = await processor.process_query(request.query)
-        logger.debug(f"Query processing result: {query_result}")
-        
-        # Step 2: Adapt query using optimized adapter
-        query_adapter = OptimizedQueryAdapter()
-        adapted_result = await query_adapter.adapt(query_result)
-        logger.debug(f"Adapted query result: {adapted_result}")
-        
-        # Step 3: Process through optimized pipeline
-        pipeline = DataPipeline()
-        requirements = adapted_result.to_data_requirements()
-        pipeline_response = await pipeline.process(requirements)
-        logger.debug(f"Pipeline response type: {type(pipeline_response)}")
-        
-        # Step 4: Adapt pipeline result
-        result_adapter = OptimizedResultAdapter()
-        pipeline_result = await result_adapter.adapt_pipeline_result(pipeline_response, start_time)
-        logger.debug(f"Pipeline result success: {pipeline_result.success}")
-        
-        if not pipeline_result.success or pipeline_result.data is None:
-            logger.error(f"Pipeline failed: {pipeline_result.error}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Pipeline processing failed: {pipeline_result.error or 'No data returned'}"
-            )
-            
-        # Step 5: Generate and execute analysis code
-        results = pipeline_result.data.get('results', {})
-        logger.debug(f"Raw results type: {type(results)}")
-        logger.debug(f"Raw results structure: {json.dumps(results, default=str)[:500]}...")
-        
-        try:
-            # Handle different result types
-            if isinstance(results, pd.DataFrame):
-                logger.debug("Results is already a DataFrame")
-                df = results
-            elif isinstance(results, dict):
-                df = pd.DataFrame([results])
-            elif isinstance(results, list):
-                df = pd.DataFrame(results)
-            else:
-                logger.error(f"Unexpected results type: {type(results)}")
-                raise ValueError(f"Cannot process results of type: {type(results)}")
-            
-            # Clean the DataFrame before normalization
-            df = clean_dataframe(df)
-            logger.debug(f"DataFrame shape after cleaning: {df.shape}")
-            logger.debug(f"Columns after cleaning: {list(df.columns)}")
-            
-            # Normalize the constructor data
-            df = normalize_constructor_data(df)
-            logger.debug(f"Final DataFrame shape: {df.shape}")
-            logger.debug(f"Final columns: {list(df.columns)}")
-            logger.debug(f"Data types: {df.dtypes}")
-            
-            if df.empty:
-                raise HTTPException(status_code=400, detail="No data available after processing")
-                
-        except Exception as e:
-            logger.error(f"DataFrame processing error: {str(e)}", exc_info=True)
-            raise HTTPException(status_code=400, detail=f"Failed to process data: {str(e)}")
+        logger.debug("Starting analysis with query: %s", request.query)
         
-        # Generate and execute code with additional logging
-        logger.debug("Generating analysis code")
-        code = generate_code(df, request.query)
-        logger.debug(f"Generated code: {code}")
-        
-        success, result, executed_code = execute_code_safely(code, df)
-        logger.debug(f"Code execution success: {success}")
+        query_norm = _normalize_query(request.query)
+        cached = _get_cached_analysis(query_norm)
+        if cached is not None:
+            logger.debug("Analysis cache hit for query: %s", query_norm)
+            result = {**cached, "processing_time": time.perf_counter() - start_time}
+        else:
+            result = await _run_analysis(request.query, start_time)
+            _cache_analysis(query_norm, result)
+            # Cache hits were already recorded when the analysis first ran
+            background_tasks.add_task(_persist_query_history, request.query, result)
         
-        if not success:
-            logger.error(f"Code execution failed: {result}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Code execution failed: {result}"
-            )
-            
-        # Return comprehensive result
-        return {
-            "success": True,
-            "data": result,
-            "executed_code": executed_code,
-            "query_trace": query_result.trace,
-            "processing_time": datetime.now().timestamp() - start_time,
-            "metadata": pipeline_result.metadata
-        }
+        return result
         
     except HTTPException as e:
-        logger.error(f"HTTP Exception: {str(e)}")
+        logger.error("HTTP Exception: %s", e)
         return {
             "success": False,
             "error": "Analysis failed",
             "details": e.detail,
-            "processing_time": datetime.now().timestamp() - start_time
+            "processing_time": time.perf_counter() - start_time
         }
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+        logger.error("Unexpected error: %s", e, exc_info=True)
         return {
             "success": False,
             "error": "Analysis failed",
             "details": str(e),
-            "processing_time": datetime.now().timestamp() - start_time
+            "processing_time": time.perf_counter() - start_time
         }
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+"""
+Micro-batching layer for the data pipeline.
+Coalesces concurrent requests arriving within a short window so identical
+requirements share a single pipeline fetch.
+"""
+
+import asyncio
+import json
+from functools import partial
+from typing import Dict, Any, List, Optional, Set
+
+from .data2 import DataPipeline
+
+class PipelineBatcher:
+    """Groups pipeline requests into short batches and de-duplicates their fetches"""
+
+    def __init__(self, pipeline: DataPipeline, max_batch_size: int = 16, max_queue_time: float = 0.02):
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time  # seconds
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._requirements: Dict[str, Any] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _batch_key(requirements: Any) -> str:
+        """Key identifying requirements that can share a fetch"""
+        return json.dumps(
+            {'endpoint': requirements.endpoint, 'params': requirements.params},
+            sort_keys=True,
+            default=str
+        )
+
+    async def process(self, requirements: Any) -> Dict[str, Any]:
+        """Queue requirements for the next batch and wait for their pipeline result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        key = self._batch_key(requirements)
+        if key not in self._waiters:
+            self._waiters[key] = []
+            self._requirements[key] = requirements
+        self._waiters[key].append(future)
+
+        if len(self._waiters) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_queue_time, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Dispatch everything queued so far as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        waiters, requirements = self._waiters, self._requirements
+        self._waiters, self._requirements = {}, {}
+        if not waiters:
+            return
+
+        # One task per distinct requirement, so each caller is released as soon
+        # as its own fetch finishes rather than waiting on the slowest in the batch
+        for key, futures in waiters.items():
+            task = asyncio.ensure_future(self.pipeline.process(requirements[key]))
+            # Keep a reference so the task isn't garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(partial(self._resolve, futures))
+
+    @staticmethod
+    def _resolve(futures: List[asyncio.Future], task: asyncio.Task) -> None:
+        """Fan a finished fetch out to every caller waiting on it"""
+        for future in futures:
+            if future.done():
+                continue  # Caller was cancelled
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
@@ -147,8 +147,10 @@ class DataPipeline:
         
         results = await asyncio.gather(*tasks, return_exceptions=True)
         
-        # Merge results with year tracking
+        # Merge results with year tracking. Each year's rows get a distinct 'year',
+        # so the merge stays duplicate-free if every part is.
         success = True
+        deduped = True
         merged_data = {'results': pd.DataFrame()}
         errors = []
         
@@ -166,6 +168,7 @@ class DataPipeline:
                 result_data = result_dict.get('data', {})
                 if isinstance(result_data, dict):
                     df = result_data.get('results', pd.DataFrame())
+                    deduped = deduped and result_dict.get('metadata', {}).get('deduped', False)
                     if not df.empty:
                         df['year'] = split_reqs[i]['metadata']['year']
                         if merged_data['results'].empty:
@@ -180,7 +183,8 @@ class DataPipeline:
             'metadata': {
                 'query_type': 'historical',
                 'years_processed': len(split_reqs),
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now().isoformat(),
+                'deduped': deduped
             }
         }
     
@@ -283,8 +287,10 @@ class DataPipeline:
             except Exception as e:
                 print(f"Error processing batch {i//batch_size + 1}: {str(e)}")
         
-        # Merge results
+        # Merge results. Each entity's rows are tagged with that entity, so the
+        # merge stays duplicate-free if every part is and no entity repeats.
         success = True
+        deduped = len(set(map(str, entities))) == len(entities)
         merged_data = {'results': pd.DataFrame()}
         errors = []
         
@@ -302,6 +308,7 @@ class DataPipeline:
                 result_data = result_dict.get('data', {})
                 if isinstance(result_data, dict):
                     df = result_data.get('results', pd.DataFrame())
+                    deduped = deduped and result_dict.get('metadata', {}).get('deduped', False)
                     if not df.empty:
                         df[entity_type] = entities[i]
                         if merged_data['results'].empty:
@@ -318,7 +325,8 @@ class DataPipeline:
                 'entities': entities,
                 'timestamp': datetime.now().isoformat(),
                 'batch_size': batch_size,
-                'total_batches': (len(entities) + batch_size - 1) // batch_size
+                'total_batches': (len(entities) + batch_size - 1) // batch_size,
+                'deduped': deduped
             }
         }
     
@@ -394,7 +402,8 @@ class DataPipeline:
                             'params': params,
                             'timestamp': datetime.now().isoformat(),
                             'attempt': attempt + 1,
-                            'rows': len(data)
+                            'rows': len(data),
+                            'deduped': response.get('metadata', {}).get('deduped', False)
                         }
                     }
                 
@@ -4,7 +4,7 @@ Includes caching, parallel processing, and performance optimizations.
 """
 
 import asyncio
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from typing import Dict, Any, Optional, List, Union, Tuple, TypeVar, Sequence, cast, Callable
 from functools import lru_cache
 from datetime import datetime
@@ -20,10 +20,11 @@ R = TypeVar('R')
 
 @dataclass
 class CacheKey:
-    """Cache key for query results"""
+    """Cache key for query results. Keys for the same query are equal
+    regardless of when they were built."""
     endpoint: str
     params_hash: str
-    timestamp: float
+    timestamp: float = field(compare=False)
 
     @classmethod
     def from_query(cls, endpoint: str, params: Dict[str, Any]) -> "CacheKey":
@@ -42,7 +43,7 @@ class CacheManager:
     """Manages caching for adapted results"""
     
     def __init__(self, max_size: int = 1000, ttl: int = 3600):
-        self.cache: Dict[CacheKey, Any] = {}
+        self.cache: Dict[CacheKey, Tuple[float, Any]] = {}  # key -> (stored at, value)
         self.max_size = max_size
         self.ttl = ttl
         self._lock = asyncio.Lock()
@@ -53,9 +54,10 @@ class CacheManager:
             return None
             
         async with self._lock:
-            if key in self.cache:
-                item = self.cache[key]
-                if datetime.now().timestamp() - key.timestamp < self.ttl:
+            entry = self.cache.get(key)
+            if entry is not None:
+                stored_at, item = entry
+                if datetime.now().timestamp() - stored_at < self.ttl:
                     return item
                 else:
                     del self.cache[key]
@@ -69,10 +71,10 @@ class CacheManager:
         async with self._lock:
             if len(self.cache) >= self.max_size:
                 # Remove oldest items
-                sorted_keys = sorted(self.cache.keys(), key=lambda k: k.timestamp)
+                sorted_keys = sorted(self.cache, key=lambda k: self.cache[k][0])
                 for old_key in sorted_keys[:len(self.cache) // 4]:  # Remove 25% oldest
                     del self.cache[old_key]
-            self.cache[key] = value
+            self.cache[key] = (key.timestamp, value)
 
 @dataclass
 class OptimizedQueryResult:
@@ -250,15 +252,16 @@ class OptimizedQueryAdapter:
             cache_key = CacheKey.from_query(result.requirements.endpoint, result.requirements.params)
             cached = await self.cache_manager.get(cache_key)
             if cached:
-                cached.cache_hit = True
-                return cached
+                # Cached results are shared across requests, so flag a copy
+                return replace(cached, cache_hit=True)
         
         # If not in cache, adapt the result
         adapted = await self._adapt_initial(result)
         
-        # Store in cache if it's a ProcessingResult
+        # Store in cache if it's a ProcessingResult, under the raw-requirements key
+        # used for lookup (adapted.cache_key reflects the rewritten endpoint/params)
         if isinstance(result, ProcessingResult):
-            await self.cache_manager.set(adapted.cache_key, adapted)
+            await self.cache_manager.set(cache_key, adapted)
         
         return adapted
     
@@ -387,10 +390,11 @@ class OptimizedPipelineResult:
         )
 
 class OptimizedResultAdapter:
-    """Enhanced result adapter with performance optimizations"""
-    
-    def __init__(self):
-        self.cache_manager = CacheManager()
+    """Enhanced result adapter with performance optimizations.
+
+    Results are not cached: a lookup needs the pipeline data in hand, and a
+    key derived from str(data) collides for DataFrames, whose repr is truncated.
+    """
     
     async def adapt_pipeline_result(self, result: Any, start_time: float) -> OptimizedPipelineResult:
         """Convert pipeline result with performance metrics"""
@@ -398,62 +402,32 @@ class OptimizedResultAdapter:
         
         if isinstance(result, dict):
             # Handle dictionary response from pipeline
-            cache_key = CacheKey.from_query(
-                "pipeline_result",
-                {"data_hash": hashlib.sha256(str(result.get('data', {})).encode()).hexdigest()}
-            )
-            
-            # Check cache
-            if cached := await self.cache_manager.get(cache_key):
-                return cast(OptimizedPipelineResult, cached)
-            
-            # Create new result
-            pipeline_result = OptimizedPipelineResult(
+            return OptimizedPipelineResult(
                 success=result.get('success', False),
                 data=result.get('data'),
                 error=result.get('error'),
                 metadata={
                     "source": "pipeline",
                     "timestamp": datetime.now().isoformat(),
-                    "cache_key": cache_key,
                     **result.get('metadata', {})
                 },
                 processing_time=processing_time,
                 cache_hit=False
             )
             
-            # Cache result
-            await self.cache_manager.set(cache_key, pipeline_result)
-            return pipeline_result
-            
         elif hasattr(result, 'success') and hasattr(result, 'data'):
             # Handle object response
-            cache_key = CacheKey.from_query(
-                "pipeline_result",
-                {"data_hash": hashlib.sha256(str(result.data).encode()).hexdigest()}
-            )
-            
-            # Check cache
-            if cached := await self.cache_manager.get(cache_key):
-                return cast(OptimizedPipelineResult, cached)
-            
-            # Create new result
-            pipeline_result = OptimizedPipelineResult(
+            return OptimizedPipelineResult(
                 success=result.success,
                 data=result.data if result.success else None,
                 error=result.error if hasattr(result, "error") else None,
                 metadata={
                     "source": "pipeline",
-                    "timestamp": datetime.now().isoformat(),
-                    "cache_key": cache_key
+                    "timestamp": datetime.now().isoformat()
                 },
                 processing_time=processing_time,
                 cache_hit=False
             )
-            
-            # Cache result
-            await self.cache_manager.set(cache_key, pipeline_result)
-            return pipeline_result
         else:
             raise ValueError(f"Unsupported result type: {type(result)}")
 
@@ -23,46 +23,23 @@ class QueryProcessor:
         self.client = AsyncOpenAI(api_key=api_key)
         # Q2: Initialize Q2 processor
         self.q2_processor = Q2Processor(self.client)
-        self.current_year = str(datetime.now().year)
+
+    @property
+    def current_year(self) -> str:
+        # Computed per call since the processor is a long-lived singleton
+        return str(datetime.now().year)
         
     async def process_query(self, query: str, use_q2: bool = True) -> ProcessingResult:
         """
         Enhanced query processing with Q2 system
         Maintains backward compatibility while allowing Q2 processing
         """
-        results = []
-        
-        # Q2: Try Q2 processing if enabled
+        # Q2 and legacy processing are independent LLM calls, so run them concurrently.
+        # Legacy always runs for comparison during phase 1.
+        legs = [self._run_legacy(query)]
         if use_q2:
-            try:
-                start_time = time.time()
-                q2_result = await self.q2_processor.process_query(query)
-                q2_time = time.time() - start_time
-                
-                results.append(ProcessingResult(
-                    requirements=q2_result.requirements,
-                    processing_time=q2_time,
-                    source='q2',
-                    confidence=q2_result.confidence,
-                    trace=q2_result.agent_trace
-                ))
-            except Exception as e:
-                print(f"Q2 processing failed: {str(e)}")
-        
-        # Always run legacy processing for comparison during phase 1
-        try:
-            start_time = time.time()
-            legacy_requirements = await self._legacy_process_query(query)
-            legacy_time = time.time() - start_time
-            
-            results.append(ProcessingResult(
-                requirements=legacy_requirements,
-                processing_time=legacy_time,
-                source='legacy',
-                confidence=0.5  # Default confidence for legacy system
-            ))
-        except Exception as e:
-            print(f"Legacy processing failed: {str(e)}")
+            legs.insert(0, self._run_q2(query))
+        results = [r for r in await asyncio.gather(*legs) if r is not None]
         
         # Choose the best result
         if not results:
@@ -80,6 +57,41 @@ class QueryProcessor:
         
         return results[0]  # Return any result if none meet criteria
             
+    async def _run_q2(self, query: str) -> Optional[ProcessingResult]:
+        """Q2: Run Q2 processing, returning None on failure"""
+        try:
+            start_time = time.time()
+            q2_result = await self.q2_processor.process_query(query)
+            q2_time = time.time() - start_time
+            
+            return ProcessingResult(
+                requirements=q2_result.requirements,
+                processing_time=q2_time,
+                source='q2',
+                confidence=q2_result.confidence,
+                trace=q2_result.agent_trace
+            )
+        except Exception as e:
+            print(f"Q2 processing failed: {str(e)}")
+            return None
+    
+    async def _run_legacy(self, query: str) -> Optional[ProcessingResult]:
+        """Run legacy processing, returning None on failure"""
+        try:
+            start_time = time.time()
+            legacy_requirements = await self._legacy_process_query(query)
+            legacy_time = time.time() - start_time
+            
+            return ProcessingResult(
+                requirements=legacy_requirements,
+                processing_time=legacy_time,
+                source='legacy',
+                confidence=0.5  # Default confidence for legacy system
+            )
+        except Exception as e:
+            print(f"Legacy processing failed: {str(e)}")
+            return None
+            
     async def _legacy_process_query(self, query: str) -> DataRequirements:
         """Original processing logic maintained for fallback"""
         try:
@@ -0,0 +1,133 @@
+"""Tests for the analysis helpers in the main application."""
+import pytest
+import pandas as pd
+
+from app import main
+from app.main import (
+    _normalize_query, _get_cached_analysis, _cache_analysis, _parse_constructor_table,
+    normalize_constructor_data, clean_dataframe,
+)
+
+FERRARI = {'constructorId': 'ferrari', 'name': 'Ferrari', 'nationality': 'Italian'}
+RED_BULL = {'constructorId': 'red_bull', 'name': 'Red Bull', 'nationality': 'Austrian'}
+
+@pytest.fixture(autouse=True)
+def clear_analysis_cache():
+    """Start every test with an empty analysis cache."""
+    main._analysis_cache.clear()
+    yield
+    main._analysis_cache.clear()
+
+def test_normalize_query():
+    """Test that queries differing only in case and whitespace share a key"""
+    assert _normalize_query("  Ferrari   2023 Points ") == "ferrari 2023 points"
+    assert _normalize_query("Ferrari 2023 points") == _normalize_query("ferrari  2023 POINTS")
+
+def test_analysis_cache_hit():
+    """Test that a cached analysis is returned for the same key"""
+    result = {"success": True, "data": {"output": "ok"}}
+    _cache_analysis("ferrari 2023 points", result)
+    assert _get_cached_analysis("ferrari 2023 points") == result
+    assert _get_cached_analysis("red bull 2023 points") is None
+
+def test_analysis_cache_expiry(monkeypatch):
+    """Test that expired entries are dropped on lookup"""
+    _cache_analysis("ferrari 2023 points", {"success": True})
+    monkeypatch.setattr(main, "ANALYSIS_CACHE_TTL", 0)
+    assert _get_cached_analysis("ferrari 2023 points") is None
+    assert "ferrari 2023 points" not in main._analysis_cache
+
+def test_analysis_cache_eviction(monkeypatch):
+    """Test that the oldest entry is evicted when the cache is full"""
+    monkeypatch.setattr(main, "ANALYSIS_CACHE_MAX_SIZE", 2)
+    _cache_analysis("a", {"success": True})
+    _cache_analysis("b", {"success": True})
+    _cache_analysis("c", {"success": True})
+    assert _get_cached_analysis("a") is None
+    assert _get_cached_analysis("b") is not None
+    assert _get_cached_analysis("c") is not None
+
+def test_normalize_constructor_data():
+    """Test that Ferrari's data is expanded onto the matching rows"""
+    df = pd.DataFrame({
+        'year': [2021, 2022, 2023],
+        'ConstructorTable': [[RED_BULL, FERRARI], [RED_BULL], str([FERRARI])]
+    }, index=[4, 7, 9])
+    
+    result = normalize_constructor_data(df)
+    
+    assert 'ConstructorTable' not in result.columns
+    assert list(result.index) == [4, 7, 9]
+    assert result.loc[4, 'name'] == 'Ferrari'
+    assert pd.isna(result.loc[7, 'name'])
+    assert result.loc[9, 'nationality'] == 'Italian'
+
+def test_normalize_constructor_data_no_match():
+    """Test that rows without Ferrari data are kept without constructor columns"""
+    df = pd.DataFrame({'year': [2021, 2022], 'ConstructorTable': [[RED_BULL], []]})
+    
+    result = normalize_constructor_data(df)
+    
+    assert list(result.columns) == ['year']
+    assert len(result) == 2
+
+def test_clean_dataframe():
+    """Test that numeric ConstructorTable rows, season mismatches and duplicates are removed"""
+    df = pd.DataFrame({
+        'year': ['2022', '2022', '2023', '2023'],
+        'season': ['2022', '2022', '2022', '2023'],
+        'points': [100, 100, 200, 300],
+        'ConstructorTable': [[FERRARI], [FERRARI], [FERRARI], '2023']
+    })
+    original = df.copy()
+    
+    result = clean_dataframe(df)
+    
+    assert list(result.columns) == ['year', 'points', 'ConstructorTable']
+    assert result['points'].tolist() == [100]
+    assert df.equals(original)
+
+def test_parse_constructor_table_cached():
+    """Test that repeated ConstructorTable strings are parsed once"""
+    raw = '[{"constructorId": "ferrari", "name": "Ferrari"}]'
+    first = _parse_constructor_table(raw)
+    
+    assert first == ({'constructorId': 'ferrari', 'name': 'Ferrari'},)
+    assert _parse_constructor_table(raw) is first
+    assert _parse_constructor_table("not a table") == ()
+
+def test_clean_dataframe_unhashable_columns():
+    """Test that duplicate removal is skipped when other columns hold lists"""
+    df = pd.DataFrame({'year': ['2023', '2023'], 'Results': [[1], [1]]})
+    
+    result = clean_dataframe(df)
+    
+    assert len(result) == 2
+
+def test_clean_dataframe_skips_dedup_for_unique_results():
+    """Test that duplicate removal can be skipped when the pipeline guarantees unique rows"""
+    df = pd.DataFrame({'driver': ['Leclerc', 'Leclerc'], 'points': [18, 18]})
+    
+    assert len(clean_dataframe(df)) == 1
+    assert len(clean_dataframe(df, deduplicate=False)) == 2
+
+def test_normalize_constructor_data_other_team():
+    """Test that the constructor to expand can be chosen per query"""
+    df = pd.DataFrame({'year': [2022, 2023], 'ConstructorTable': [[FERRARI, RED_BULL], [FERRARI]]})
+    
+    result = normalize_constructor_data(df, 'red_bull')
+    
+    assert result.loc[0, 'name'] == 'Red Bull'
+    assert pd.isna(result.loc[1, 'name'])
+
+def test_clean_dataframe_numeric_constructor_rows():
+    """Test that only numbers, NaN and digit-only strings count as numeric ConstructorTable rows"""
+    df = pd.DataFrame({
+        'row': range(6),
+        'ConstructorTable': [[FERRARI], 2023, float('nan'), '2023', '3.5', ' 7']
+    })
+    
+    result = clean_dataframe(df)
+    
+    assert result['row'].tolist() == [0, 4, 5]
+
@@ -0,0 +1,60 @@
+"""Tests for code generation caching."""
+import pytest
+import pandas as pd
+
+from app.analyst import generate
+from app.analyst.generate import generate_code, discard_generated_code, execute_code_safely, _compile_code
+
+class FakeGenerator:
+    """Code generator stub that counts model calls."""
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt: str) -> str:
+        self.calls += 1
+        return "```python\nresult = data['points'].sum()\n```"
+
+@pytest.fixture
+def fake_generator(monkeypatch):
+    """Replace the model-backed generator and start with an empty code cache."""
+    generator = FakeGenerator()
+    monkeypatch.setattr(generate, "get_code_generator", lambda model_name: generator)
+    generate._code_cache.clear()
+    yield generator
+    generate._code_cache.clear()
+
+def test_generate_code_cached_by_query_and_schema(fake_generator):
+    """Test that the same query against the same schema reuses generated code"""
+    df = pd.DataFrame({'year': [2022, 2023], 'points': [554.0, 406.0]})
+
+    first = generate_code(df, "Show Ferrari points")
+    second = generate_code(df.head(1), "  show ferrari POINTS ")
+
+    assert first == "result = data['points'].sum()"
+    assert second == first
+    assert fake_generator.calls == 1
+
+def test_generate_code_cache_misses_on_schema_change(fake_generator):
+    """Test that a different schema triggers a new generation"""
+    generate_code(pd.DataFrame({'points': [1.0]}), "Show Ferrari points")
+    generate_code(pd.DataFrame({'points': ['1']}), "Show Ferrari points")
+
+    assert fake_generator.calls == 2
+
+def test_compile_code_cached():
+    """Test that identical sources compile to the same code object"""
+    assert _compile_code("x = 1") is _compile_code("x = 1")
+
+def test_failed_code_discarded_from_cache(fake_generator):
+    """Test that code which fails to execute is regenerated on the next request"""
+    df = pd.DataFrame({'year': [2022, 2023], 'wins': [4, 1]})
+
+    code = generate_code(df, "Show Ferrari points")
+    success, _, _ = execute_code_safely(code, df)
+    assert not success
+
+    discard_generated_code(df, "Show Ferrari points")
+    generate_code(df, "Show Ferrari points")
+
+    assert fake_generator.calls == 2
+
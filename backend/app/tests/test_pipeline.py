@@ -1,11 +1,14 @@
 """Tests for the pipeline components."""
+import asyncio
 import pytest
 import pandas as pd
 from datetime import datetime
 import time
 
 from app.pipeline.data2 import DataPipeline
-from app.pipeline.optimized_adapters import OptimizedQueryAdapter, OptimizedResultAdapter
+from app.pipeline.batcher import PipelineBatcher
+from app.query.models import DataRequirements, ProcessingResult
+from app.pipeline.optimized_adapters import OptimizedQueryAdapter, OptimizedResultAdapter, CacheKey, CacheManager
 
 @pytest.mark.asyncio
 async def test_pipeline_processing(sample_pipeline_result):
@@ -78,4 +81,89 @@ async def test_result_adapter(sample_pipeline_result):
     assert adapted.data is not None
     assert 'results' in adapted.data
     assert adapted.metadata['query_type'] == 'historical'
-    assert 'processing_time' in adapted.metadata 
\ No newline at end of file
+    assert 'processing_time' in adapted.metadata 
+
+@pytest.mark.asyncio
+async def test_pipeline_batcher_coalesces_requests():
+    """Test that concurrent identical requirements share one pipeline fetch"""
+    class CountingPipeline(DataPipeline):
+        def __init__(self):
+            self.calls = []
+        
+        async def process(self, requirements):
+            self.calls.append(requirements.params)
+            return {'success': True, 'data': {'results': requirements.params}}
+    
+    pipeline = CountingPipeline()
+    batcher = PipelineBatcher(pipeline, max_queue_time=0.01)
+    ferrari = DataRequirements(endpoint='CONSTRUCTORS.year', params={'constructor': 'ferrari', 'year': '2023'})
+    mclaren = DataRequirements(endpoint='CONSTRUCTORS.year', params={'year': '2023', 'constructor': 'mclaren'})
+    
+    results = await asyncio.gather(
+        batcher.process(ferrari),
+        batcher.process(DataRequirements(endpoint=ferrari.endpoint, params=dict(ferrari.params))),
+        batcher.process(mclaren)
+    )
+    
+    assert len(pipeline.calls) == 2
+    assert results[0] is results[1]
+    assert results[2]['data']['results']['constructor'] == 'mclaren'
+
+@pytest.mark.asyncio
+async def test_cache_manager_hits_on_equal_keys():
+    """Test that keys built at different times for the same query share an entry"""
+    cache = CacheManager(max_size=4)
+    params = {'constructor': 'ferrari', 'year': '2023'}
+    await cache.set(CacheKey.from_query('CONSTRUCTORS.year', params), 'cached')
+    
+    assert await cache.get(CacheKey.from_query('CONSTRUCTORS.year', dict(params))) == 'cached'
+    assert await cache.get(CacheKey.from_query('CONSTRUCTORS.year', {'year': '2022'})) is None
+    
+    # Expiry is measured from when the entry was stored, not from the lookup key
+    cache.ttl = 0
+    assert await cache.get(CacheKey.from_query('CONSTRUCTORS.year', params)) is None
+    assert not cache.cache
+
+@pytest.mark.asyncio
+async def test_pipeline_batcher_does_not_hold_fast_requests():
+    """Test that a fast requirement is returned without waiting for a slow one in its batch"""
+    class DelayedPipeline(DataPipeline):
+        def __init__(self):
+            pass
+        
+        async def process(self, requirements):
+            await asyncio.sleep(requirements.params['delay'])
+            return {'success': True, 'data': {'results': requirements.params}}
+    
+    batcher = PipelineBatcher(DelayedPipeline(), max_queue_time=0.01)
+    slow = asyncio.ensure_future(batcher.process(DataRequirements(endpoint='DRIVERS.year', params={'delay': 0.5})))
+    
+    start = time.perf_counter()
+    fast = await batcher.process(DataRequirements(endpoint='DRIVERS.year', params={'delay': 0.01}))
+    
+    assert fast['data']['results']['delay'] == 0.01
+    assert time.perf_counter() - start < 0.25
+    assert not slow.done()
+    await slow
+
+@pytest.mark.asyncio
+async def test_query_adapter_cache_hit():
+    """Test that adapting the same raw /api/f1 requirements twice hits the cache"""
+    adapter = OptimizedQueryAdapter()
+    
+    def processing_result():
+        return ProcessingResult(
+            requirements=DataRequirements(endpoint='/api/f1/constructors', params={'season': '2023'}),
+            processing_time=0.1,
+            source='q2',
+            confidence=1.0
+        )
+    
+    first = await adapter.adapt(processing_result())
+    second = await adapter.adapt(processing_result())
+    
+    assert first.cache_hit is False
+    assert second.cache_hit is True
+    assert second.endpoint == first.endpoint
+    assert second.params == first.params
+